@@ -4,41 +4,135 @@
 # You can use the code from https://github.com/torvalds/linux/blob/v6.3-rc7/drivers/gpu/drm/exynos/exynos_drm_dsi.c#L800-L866
 # (later moved to drivers/gpu/drm/bridge/samsung-dsim.c)
 # to convert these bits to actual mipi data.
-print("""Instructions:
+
+import argparse
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# DSIM_CONFIG bit positions
+DSIM_HSA_DISABLE_MODE = 20
+DSIM_HBP_DISABLE_MODE = 21
+DSIM_HFP_DISABLE_MODE = 22
+DSIM_HSE_DISABLE_MODE = 23
+DSIM_AUTO_MODE = 24
+DSIM_VIDEO_MODE = 25
+DSIM_BURST_MODE = 26
+DSIM_SYNC_INFORM = 27
+DSIM_EOT_DISABLE = 28
+DSIM_MFLUSH_VS = 29
+DSIM_CLKLANE_STOP = 30
+
+# include/drm/drm_mipi_dsi.h
+MIPI_DSI_MODE_VIDEO = 1 << 0
+MIPI_DSI_MODE_VIDEO_BURST = 1 << 1
+MIPI_DSI_MODE_VIDEO_SYNC_PULSE = 1 << 2
+MIPI_DSI_MODE_VIDEO_AUTO_VERT = 1 << 3
+MIPI_DSI_MODE_VIDEO_HSE = 1 << 4
+MIPI_DSI_MODE_VIDEO_NO_HFP = 1 << 5
+MIPI_DSI_MODE_VIDEO_NO_HBP = 1 << 6
+MIPI_DSI_MODE_VIDEO_NO_HSA = 1 << 7
+MIPI_DSI_MODE_VSYNC_FLUSH = 1 << 8
+MIPI_DSI_MODE_NO_EOT_PACKET = 1 << 9
+MIPI_DSI_CLOCK_NON_CONTINUOUS = 1 << 10
+
+# In output order.
+MIPI_DSI_FLAGS = [
+    ("MIPI_DSI_MODE_VIDEO", MIPI_DSI_MODE_VIDEO),
+    ("MIPI_DSI_MODE_VSYNC_FLUSH", MIPI_DSI_MODE_VSYNC_FLUSH),
+    ("MIPI_DSI_MODE_VIDEO_SYNC_PULSE", MIPI_DSI_MODE_VIDEO_SYNC_PULSE),
+    ("MIPI_DSI_MODE_VIDEO_BURST", MIPI_DSI_MODE_VIDEO_BURST),
+    ("MIPI_DSI_MODE_VIDEO_AUTO_VERT", MIPI_DSI_MODE_VIDEO_AUTO_VERT),
+    ("MIPI_DSI_MODE_VIDEO_HSE", MIPI_DSI_MODE_VIDEO_HSE),
+    ("MIPI_DSI_MODE_VIDEO_NO_HFP", MIPI_DSI_MODE_VIDEO_NO_HFP),
+    ("MIPI_DSI_MODE_VIDEO_NO_HBP", MIPI_DSI_MODE_VIDEO_NO_HBP),
+    ("MIPI_DSI_MODE_VIDEO_NO_HSA", MIPI_DSI_MODE_VIDEO_NO_HSA),
+    ("MIPI_DSI_MODE_NO_EOT_PACKET", MIPI_DSI_MODE_NO_EOT_PACKET),
+    ("MIPI_DSI_CLOCK_NON_CONTINUOUS", MIPI_DSI_CLOCK_NON_CONTINUOUS),
+]
+
+def classify(dsim_cfg):
+    """Get the MIPI DSI mode flags for a DSIM_CONFIG value, as a bitmask."""
+    video = (dsim_cfg >> DSIM_VIDEO_MODE) & 1
+    flags = video * MIPI_DSI_MODE_VIDEO
+    flags |= video * (((dsim_cfg >> DSIM_MFLUSH_VS) & 1) ^ 1) * MIPI_DSI_MODE_VSYNC_FLUSH
+    flags |= video * ((dsim_cfg >> DSIM_SYNC_INFORM) & 1) * MIPI_DSI_MODE_VIDEO_SYNC_PULSE
+    flags |= video * ((dsim_cfg >> DSIM_BURST_MODE) & 1) * MIPI_DSI_MODE_VIDEO_BURST
+    flags |= video * ((dsim_cfg >> DSIM_AUTO_MODE) & 1) * MIPI_DSI_MODE_VIDEO_AUTO_VERT
+    flags |= video * ((dsim_cfg >> DSIM_HSE_DISABLE_MODE) & 1) * MIPI_DSI_MODE_VIDEO_HSE
+    flags |= video * ((dsim_cfg >> DSIM_HFP_DISABLE_MODE) & 1) * MIPI_DSI_MODE_VIDEO_NO_HFP
+    flags |= video * ((dsim_cfg >> DSIM_HBP_DISABLE_MODE) & 1) * MIPI_DSI_MODE_VIDEO_NO_HBP
+    flags |= video * ((dsim_cfg >> DSIM_HSA_DISABLE_MODE) & 1) * MIPI_DSI_MODE_VIDEO_NO_HSA
+    flags |= ((dsim_cfg >> DSIM_EOT_DISABLE) & 1) * MIPI_DSI_MODE_NO_EOT_PACKET
+    # Apparently unsupported on Exynos 4, but is on other chips:
+    # flags |= ((dsim_cfg >> DSIM_CLKLANE_STOP) & 1) * MIPI_DSI_CLOCK_NON_CONTINUOUS
+    return flags
+
+def classify_batch(dsim_cfgs):
+    """Run classify() over an array of DSIM_CONFIG values, compiled with numba if available."""
+    try:
+        from numba import njit, prange
+    except ImportError:
+        # classify() only shifts, ands and multiplies, so it works on whole arrays too.
+        return classify(dsim_cfgs).astype(np.uint32)
+
+    classify_jit = njit(classify)
+
+    @njit(parallel=True)
+    def classify_batch_jit(dsim_cfgs):
+        out = np.empty(dsim_cfgs.shape[0], dtype=np.uint32)
+        for i in prange(dsim_cfgs.shape[0]):
+            out[i] = classify_jit(dsim_cfgs[i])
+        return out
+
+    return classify_batch_jit(dsim_cfgs)
+
+def flag_names(flags: int) -> list:
+    """Convert a bitmask returned by classify() to flag names."""
+    return [name for name, flag in MIPI_DSI_FLAGS if flags & flag]
+
+def main():
+    parser = argparse.ArgumentParser(
+                        prog='dsim-to-flags.py',
+                        description='Convert DSIM_CONFIG register values to MIPI DSI mode flags')
+
+    parser.add_argument("--cfg", help="DSIM_CONFIG value, in hex (asked for interactively if not given)")
+    parser.add_argument("--batch", metavar="FILE", help="Decode a file with one DSIM_CONFIG value per line (requires numpy)")
+
+    args = parser.parse_args()
+
+    if args.batch:
+        if np is None:
+            parser.error("--batch requires numpy")
+
+        values = []
+        with open(args.batch) as batch_in:
+            for lineno, line in enumerate(batch_in, 1):
+                if not line.strip():
+                    continue
+                m = re.fullmatch(r'(?:0x)?([0-9a-f]{1,8})', line.strip(), re.IGNORECASE)
+                if m is None:
+                    parser.error(f"{args.batch}:{lineno}: expected a DSIM_CONFIG value, got {line.strip()!r}")
+                values.append(int(m.group(1), 16))
+
+        arr = np.array(values, dtype=np.uint32)
+        for dsim_cfg, flags in zip(arr, classify_batch(arr)):
+            print(f"0x{dsim_cfg:08x}:", " | ".join(flag_names(flags)))
+        return
+
+    dsim_cfg = args.cfg
+    if dsim_cfg is None:
+        print("""Instructions:
 In the downstream kernel, run:
    cat /sys/devices/platform/s5p-dsim.0/dsim_dump""")
 
-dsim_cfg = input("Then copy out the value from \"[DSIM]0x11C8_0010\" and paste it here, with the 0x prefix: ")
-dsim_cfg = int(dsim_cfg, 16)
-
-dsim_cfg_bits=[("DSIM_HSA_DISABLE_MODE", 20), ("DSIM_HBP_DISABLE_MODE", 21), ("DSIM_HFP_DISABLE_MODE", 22), ("DSIM_HSE_DISABLE_MODE", 23), ("DSIM_AUTO_MODE", 24), ("DSIM_VIDEO_MODE", 25), ("DSIM_BURST_MODE", 26), ("DSIM_SYNC_INFORM", 27), ("DSIM_EOT_DISABLE", 28), ("DSIM_MFLUSH_VS", 29), ("DSIM_CLKLANE_STOP", 30)]
-dsim_cfg_parsed = {}
-for name, bit in dsim_cfg_bits:
-    dsim_cfg_parsed[name] = bool(dsim_cfg & (1<<bit))
-
-flags = []
-if dsim_cfg_parsed["DSIM_VIDEO_MODE"]:
-    flags.append("MIPI_DSI_MODE_VIDEO")
-    if not dsim_cfg_parsed["DSIM_MFLUSH_VS"]:
-        flags.append("MIPI_DSI_MODE_VSYNC_FLUSH")
-    if dsim_cfg_parsed["DSIM_SYNC_INFORM"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_SYNC_PULSE")
-    if dsim_cfg_parsed["DSIM_BURST_MODE"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_BURST")
-    if dsim_cfg_parsed["DSIM_AUTO_MODE"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_AUTO_VERT")
-    if dsim_cfg_parsed["DSIM_HSE_DISABLE_MODE"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_HSE")
-    if dsim_cfg_parsed["DSIM_HFP_DISABLE_MODE"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_NO_HFP")
-    if dsim_cfg_parsed["DSIM_HBP_DISABLE_MODE"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_NO_HBP")
-    if dsim_cfg_parsed["DSIM_HSA_DISABLE_MODE"]:
-        flags.append("MIPI_DSI_MODE_VIDEO_NO_HSA")
-if dsim_cfg_parsed["DSIM_EOT_DISABLE"]:
-    flags.append("MIPI_DSI_MODE_NO_EOT_PACKET")
-# Apparently unsupported on Exynos 4, but is on other chips:
-# if dsim_cfg_parsed["DSIM_CLKLANE_STOP"]:
-# 	flags.append("MIPI_DSI_CLOCK_NON_CONTINUOUS")
-
-print(" | ".join(flags))
+        dsim_cfg = input("Then copy out the value from \"[DSIM]0x11C8_0010\" and paste it here, with the 0x prefix: ")
+    dsim_cfg = int(dsim_cfg, 16)
+
+    print(" | ".join(flag_names(classify(dsim_cfg))))
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,14 @@
 # See https://knuxify.github.io/blog/2023/04/tab3-display.html for more information.
 # You can use the code from drivers/gpu/drm/exynos/exynos_drm_fimd.c
 # to convert these bits to actual parameters.
-print("""Instructions:
-In the downstream kernel, run:
-   cat /sys/class/graphics/fb0/device/fimd_dump
-Then, from 11C00000 (the first line), copy out:""")
 
-vidcon0_cfg = input("The first 8-digit value: ")
-vidcon0_cfg = int('0x' + vidcon0_cfg if not vidcon0_cfg.startswith('0x') else vidcon0_cfg, 16)
+import argparse
+import re
 
-vidcon1_cfg = input("The second 8-digit value: ")
-vidcon1_cfg = int('0x' + vidcon1_cfg if not vidcon1_cfg.startswith('0x') else vidcon1_cfg, 16)
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # include/video/samsung_fimd.h
 vidcon1_regs = (
@@ -22,7 +20,65 @@ vidcon1_regs = (
     ("VIDCON1_INV_VDEN", 4),
 )
 
-for regname, shift in vidcon1_regs:
-    print(regname, vidcon1_cfg & (1 << shift))
+def print_flags(vidcon0_cfg: int, vidcon1_cfg: int):
+    for regname, shift in vidcon1_regs:
+        print(regname, vidcon1_cfg & (1 << shift))
+
+    print("VIDCON0_DSI_EN", vidcon0_cfg & (1 << 30))
+
+def main():
+    parser = argparse.ArgumentParser(
+                        prog='fimd-to-flags.py',
+                        description='Print the FIMD VIDCON0/VIDCON1 bits needed for the fimd node')
+
+    parser.add_argument("--vidcon0", help="VIDCON0 value, in hex (asked for interactively if not given)")
+    parser.add_argument("--vidcon1", help="VIDCON1 value, in hex (asked for interactively if not given)")
+    parser.add_argument("--batch", metavar="FILE", help="Decode a file with one \"VIDCON0 VIDCON1\" value pair per line (requires numpy)")
+
+    args = parser.parse_args()
+
+    if args.batch:
+        if np is None:
+            parser.error("--batch requires numpy")
+
+        values = []
+        with open(args.batch) as batch_in:
+            for lineno, line in enumerate(batch_in, 1):
+                if not line.strip():
+                    continue
+                m = re.fullmatch(r'(?:0x)?([0-9a-f]{1,8})\s+(?:0x)?([0-9a-f]{1,8})', line.strip(), re.IGNORECASE)
+                if m is None:
+                    parser.error(f"{args.batch}:{lineno}: expected a \"VIDCON0 VIDCON1\" value pair, got {line.strip()!r}")
+                values.append((int(m.group(1), 16), int(m.group(2), 16)))
+
+        arr = np.array(values, dtype=np.uint32).reshape(-1, 2)
+        masks = np.array([1 << shift for _, shift in vidcon1_regs], dtype=np.uint32)
+        vidcon1_bits = arr[:, 1, None] & masks[None, :]
+        dsi_en = arr[:, 0] & np.uint32(1 << 30)
+
+        for (vidcon0_cfg, vidcon1_cfg), row, dsi_en_bit in zip(arr, vidcon1_bits, dsi_en):
+            print(f"0x{vidcon0_cfg:08x} 0x{vidcon1_cfg:08x}:")
+            for (regname, _), bit in zip(vidcon1_regs, row):
+                print(regname, bit)
+            print("VIDCON0_DSI_EN", dsi_en_bit)
+        return
+
+    vidcon0_cfg, vidcon1_cfg = args.vidcon0, args.vidcon1
+    if vidcon0_cfg is None or vidcon1_cfg is None:
+        print("""Instructions:
+In the downstream kernel, run:
+   cat /sys/class/graphics/fb0/device/fimd_dump
+Then, from 11C00000 (the first line), copy out:""")
+
+    if vidcon0_cfg is None:
+        vidcon0_cfg = input("The first 8-digit value: ")
+    vidcon0_cfg = int(vidcon0_cfg.removeprefix('0x'), 16)
+
+    if vidcon1_cfg is None:
+        vidcon1_cfg = input("The second 8-digit value: ")
+    vidcon1_cfg = int(vidcon1_cfg.removeprefix('0x'), 16)
+
+    print_flags(vidcon0_cfg, vidcon1_cfg)
 
-print("VIDCON0_DSI_EN", vidcon0_cfg & (1 << 30))
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,29 @@
 # kona-clockgen - given a BCM Kona clock definition from clock.c, generate a mainline struct for it.
 
 import argparse
-from dataclasses import dataclass, fields
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from functools import lru_cache
 from typing import Optional, Union, Self
+import json
+import mmap
 import os.path
 import re
 
 # World's Worst C parser
 rex = re.compile(r'\W+')
-def unroll_macro(header_str: str, macro_name: str):
-    """Find a macro in the header and unroll it."""
-    out = ""
-    for line in header_str.split('\n'):
-        if "#define" in line and macro_name in line:
-            out = line.strip().replace('\t', ' ')
-            if line.strip().endswith(r'/'):
-                out = out[:-1]
-                continue
-            break
-        if out:
-            out += line.strip()
-            if not line.strip().endswith(r'/'):
-                break
-            else:
-                out = out[:-1]
-    macro_value = ' '.join(rex.sub(' ', out).split(" ")[3:])
+_WS_TABLE = str.maketrans('', '', ' \t\n\r')
+# Either ".key=value", ".key={" (start of a nested struct), or a bare "{" or
+# "}" (e.g. from a compound literal like "(struct clk*[]){...}").
+_STRUCT_ITEM = re.compile(r'\.(\w+)=(\{|[^,{}]*)|([{}])')
+
+_INT_LITERAL = re.compile(r'0x[0-9a-fA-F]+|\d+')
+
+_DEFINE = re.compile(rb'^[ \t]*#define[ \t]+(\w+)[ \t]+((?:.*\\\n)*.+)$', re.MULTILINE)
+
+def parse_macro_value(value: str):
+    """Convert the value of a macro to an int, if possible."""
+    macro_value = ' '.join(rex.sub(' ', value).split())
 
     if '0x' in macro_value:
         return int(macro_value, 16)
@@ -32,88 +31,113 @@ def unroll_macro(header_str: str, macro_name: str):
         return int(macro_value)
     return macro_value
 
-def struct_to_dict(struct_str: str):
-    """Convert a C struct to a dictionary."""
-    out = {}
+@lru_cache(maxsize=None)
+def _macro_table(path: str) -> dict:
+    """Parse all macros in the header into a {name: value} table."""
+    with open(path, 'rb') as header_raw, \
+            mmap.mmap(header_raw.fileno(), 0, access=mmap.ACCESS_READ) as header:
+        return {m.group(1).decode(): parse_macro_value(m.group(2).decode().replace('\\\n', ' '))
+                for m in _DEFINE.finditer(header)}
+
+def struct_items(struct_str: str):
+    """Yield (parent, key, value) for each member of a C struct, as it is parsed.
+
+    parent is the name of the enclosing nested struct, or None at the top
+    level; a value of '{' starts a nested struct."""
     nest = []
 
-    # Step 1. Skip first line and last line.
-    struct_str = '\n'.join(struct_str.split('\n')[1:-1])
+    # Step 1. Skip the declaration and the closing brace.
+    struct_str = struct_str[struct_str.index('{') + 1:struct_str.rindex('}')]
 
     # Step 2. Strip out any and all whitespace.
-    struct_str = struct_str.replace(' ', '')
-    struct_str = struct_str.replace('\n', '')
-    struct_str = struct_str.replace('\t', '')
-    struct_str = struct_str.strip()
+    struct_str = struct_str.translate(_WS_TABLE)
 
     # Step 3. Identify key/value pairs.
-    for item in struct_str.split('.'):
-        if not item:
+    for m in _STRUCT_ITEM.finditer(struct_str):
+        key, value, brace = m.groups()
+        if brace == '{':
+            # Not a nested struct; None makes sure its "}" pops the right entry.
+            nest.append(None)
+            continue
+        elif brace == '}':
+            if nest:
+                nest.pop()
+            continue
+
+        if None in nest:
+            # Member of a compound literal; not part of the struct itself.
+            if value == '{':
+                nest.append(None)
             continue
-        try:
-            key, value = [x.strip() for x in item.split('=')]
-        except:
-            raise ValueError(item)
+
+        yield (nest[-1] if nest else None, key, value)
+
         if value == '{':
             nest.append(key)
             if len(nest) > 1:
                 raise ValueError("TODO")
+
+def struct_to_dict(struct_str: str, executor: Optional[Executor] = None):
+    """Convert a C struct to a dictionary.
+
+    If an executor is given, the register headers referenced by the struct
+    are parsed on it while the rest of the struct is still being read."""
+    out = {}
+    prefetched = set()
+
+    for parent, key, value in struct_items(struct_str):
+        if value == '{':
             out[key] = {}
-        elif '}' in value:
-            nest.pop()
+            continue
+
+        if parent:
+            out[parent][key] = value # TODO
         else:
-            if nest:
-                out[nest[-1]][key] = value.split(',')[0] # TODO
-            else:
-                out[key] = value.split(',')[0]
+            out[key] = value
+
+        if executor is not None and "CLK_MGR_REG" in value:
+            path = header_path(value)
+            if path not in prefetched:
+                prefetched.add(path)
+                executor.submit(_macro_table, path)
 
-    # Step 4. Return finished struct.
     return out
 
-def find_clock(clock_str: str, name: str) -> Optional[Union[str, str]]:
+def find_clock(clock_buf: bytes, name: str) -> Optional[Union[str, str]]:
     """Find the struct containing clock data. Returns union of (typestr, struct)."""
-    out = []
-    clk_type = None
-    for line in clock_str.split('\n'):
-        if f"CLK_NAME({name})" in line:
-            if "bus_clk" in line:
-                clk_type = "bus"
-            elif "peri_clk" in line:
-                clk_type = "peri"
-            elif "ref_clk" in line:
-                clk_type = "ref"
-            else:
-                raise ValueError(f"Unknown clock type for {line}")
-
-        if clk_type is not None:
-            out.append(line)
-            if "};" in line:
-                break
-
-    if clk_type is None:
+    m = re.search(rb'^[^\n]*\b(bus|peri|ref)_clk\b[^;\n]*CLK_NAME\(' + re.escape(name.encode()) + rb'\)[\s\S]*?\};',
+                  clock_buf, re.MULTILINE)
+    if m is None:
         return None
 
-    return (clk_type, '\n'.join(out))
+    return (m.group(1).decode(), m.group(0).decode())
 
 # Dataclasses go brrr
 
-def unroll_all_macros(clock_dict: dict):
-    out = clock_dict.copy()
-    for key, value in clock_dict.items():
-        if isinstance(value, dict):
-            out[key] = unroll_all_macros(value)
-        elif isinstance(value, str) and "CLK_MGR_REG" in value:
-            header_name = 'brcm_rdb_' + value.split('_')[0].lower() + '_clk_mgr_reg.h'
-            header_path = os.path.join(args.kernel_path, 'arch', 'arm', f'mach-{args.mach}', 'include', 'mach', 'rdb', header_name)
-            with open(header_path) as header_raw:
-                out[key] = unroll_macro(header_raw.read(), value)
+def header_path(macro_name: str) -> str:
+    """Get the path to the register header defining a CLK_MGR_REG macro."""
+    header_name = 'brcm_rdb_' + macro_name.split('_')[0].lower() + '_clk_mgr_reg.h'
+    return os.path.join(args.kernel_path, 'arch', 'arm', f'mach-{args.mach}', 'include', 'mach', 'rdb', header_name)
 
-    return out
+def unroll_macro(value):
+    """Resolve a CLK_MGR_REG macro from its register header and convert plain
+    integer literals (e.g. .mask_set = 0) to ints; other values are returned as-is.
+
+    Macros missing from the header (e.g. a *_SHIFT derived from a *_MASK that
+    the header doesn't define) are returned unresolved, by name."""
+    if not isinstance(value, str):
+        return value
+    if "CLK_MGR_REG" not in value:
+        return parse_macro_value(value) if _INT_LITERAL.fullmatch(value) else value
+    return _macro_table(header_path(value)).get(value, value)
 
 def mask_to_width(mask: int):
-    return bin(mask).count('1')
+    return mask.bit_count()
+
+_STRUCT_TMPL = '''static struct {clk_type}_clk_data {name}_data = {{
+{policy}{gate}{hyst}{sel}{div}{trig}}};'''
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ClockInfo:
     flags: str = ""
 
@@ -121,7 +145,7 @@ class ClockInfo:
     def from_dict(cls, payload: dict) -> Self:
         return cls(flags=payload.get('flags', ""))
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ClockDiv:
     div_offset: Optional[int] = None
     div_mask: Optional[int] = None
@@ -143,18 +167,18 @@ class ClockDiv:
     @classmethod
     def from_dict(cls, payload: dict) -> Self:
         kwargs = {}
-        for field in fields(cls):
-            if field.name in payload:
-                kwargs[field.name] = payload.get(field.name)
-                if field.name.endswith('mask') and field.name[:-4] + 'shift' not in payload:
-                    kwargs[field.name[:-4] + 'shift'] = payload[field.name][:-4] + 'SHIFT'
-
-        kwargs = unroll_all_macros(kwargs)
+        for key, value in payload.items():
+            if key not in cls._FIELDS:
+                continue
+            kwargs[key] = unroll_macro(value)
+            if key.endswith('mask') and key[:-4] + 'shift' not in payload:
+                kwargs[key[:-4] + 'shift'] = unroll_macro(value[:-4] + 'SHIFT')
 
         return cls(**kwargs)
 
+ClockDiv._FIELDS = frozenset(field.name for field in fields(ClockDiv))
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PeriClock:
     __clk_type__ = 'peri'
 
@@ -187,26 +211,24 @@ class PeriClock:
     @classmethod
     def from_dict(cls, payload: dict, name: Optional[str] = None) -> Self:
         kwargs = {}
-        for field in fields(cls):
-            if field.name in payload:
-                if field.name == 'clk_div':
-                    kwargs[field.name] = ClockDiv.from_dict(payload[field.name])
-                elif field.name == 'clk':
-                    kwargs[field.name] = ClockInfo.from_dict(payload[field.name])
-                else:
-                    kwargs[field.name] = payload[field.name]
-                    if field.name.endswith('mask'):
-                        kwargs[field.name[:-4] + 'shift'] = payload[field.name][:-4] + 'SHIFT'
+        for key, value in payload.items():
+            if key not in cls._FIELDS:
+                continue
+            if key == 'clk_div':
+                kwargs[key] = ClockDiv.from_dict(value)
+            elif key == 'clk':
+                kwargs[key] = ClockInfo.from_dict(value)
+            else:
+                kwargs[key] = unroll_macro(value)
+                if key.endswith('mask') and key[:-4] + 'shift' not in payload:
+                    kwargs[key[:-4] + 'shift'] = unroll_macro(value[:-4] + 'SHIFT')
 
-        kwargs = unroll_all_macros(kwargs)
         kwargs['name'] = name
 
         return cls(**kwargs)
 
     def to_mainline_struct(self):
         """Returns the mainline struct."""
-        out = [f'static struct {self.__clk_type__}_clk_data {self.name}_data = {{']
-
         # .clocks: CLOCKS(), fill with names of source clocks; TODO
         has_clocks = False
         if self.src:
@@ -214,50 +236,52 @@ class PeriClock:
             has_clocks = True
 
         # .policy:
+        policy = ''
         if self.policy_bit_mask is not None:
-            out.append(f'\t.policy\t\t= POLICY(0xFIXME_{self.mask_set}, {self.policy_bit_shift}),')
+            policy = f'\t.policy\t\t= POLICY(0xFIXME_{self.mask_set}, {self.policy_bit_shift}),\n'
 
         # .gate:
         if self.gating_sel_shift is not None:
-            auto = ''
-            if 'AUTO_GATE' in self.clk.flags:
-                auto = '_AUTO'
-            out.append(f'\t.gate\t\t= HW_SW_GATE{auto}(0x{self.clk_gate_offset:04x}, {self.stprsts_shift}, {self.gating_sel_shift}, {self.clk_en_shift}),')
+            auto = '_AUTO' if 'AUTO_GATE' in self.clk.flags else ''
+            gate = f'\t.gate\t\t= HW_SW_GATE{auto}(0x{self.clk_gate_offset:04x}, {self.stprsts_shift}, {self.gating_sel_shift}, {self.clk_en_shift}),\n'
         else:
-            hwsw = 'SW'
-            if 'AUTO_GATE' in self.clk.flags:
-                hwsw = 'HW'
-            out.append(f'\t.gate\t\t= {hwsw}_ONLY_GATE(0x{self.clk_gate_offset:04x}, {self.stprsts_shift}, {self.clk_en_shift}),')
+            hwsw = 'HW' if 'AUTO_GATE' in self.clk.flags else 'SW'
+            gate = f'\t.gate\t\t= {hwsw}_ONLY_GATE(0x{self.clk_gate_offset:04x}, {self.stprsts_shift}, {self.clk_en_shift}),\n'
 
         # .hyst:
+        hyst = ''
         if self.hyst_val_mask is not None and int(self.hyst_en_mask):
-            out.append(f'\t.hyst\t\t= HYST(0x{self.clk_gate_offset:04x}, {self.hyst_val_shift}, {self.hyst_en_shift}),')
+            hyst = f'\t.hyst\t\t= HYST(0x{self.clk_gate_offset:04x}, {self.hyst_val_shift}, {self.hyst_en_shift}),\n'
 
+        sel = div = trig = ''
         if self.clk_div is not None:
             # .sel:
             if self.clk_div.pll_select_offset is not None:
-                out.append(f'\t.sel\t\t= SELECTOR(0x{self.clk_div.pll_select_offset:04x}, {self.clk_div.pll_select_shift}, {mask_to_width(self.clk_div.pll_select_mask)}),')
+                sel = f'\t.sel\t\t= SELECTOR(0x{self.clk_div.pll_select_offset:04x}, {self.clk_div.pll_select_shift}, {mask_to_width(self.clk_div.pll_select_mask)}),\n'
             # .div:
             if self.clk_div.div_offset is not None:
                 if self.clk_div.diether_bits is not None:
                     print("TODO verify diether bits")
-                    out.append(f'\t.div\t\t= FRAC_DIVIDER(0x{self.clk_div.div_offset:04x}, {self.clk_div.div_shift}, {mask_to_width(self.clk_div.div_mask)}, {self.clk_div.diether_bits}),')
+                    div = f'\t.div\t\t= FRAC_DIVIDER(0x{self.clk_div.div_offset:04x}, {self.clk_div.div_shift}, {mask_to_width(self.clk_div.div_mask)}, {self.clk_div.diether_bits}),\n'
                 else:
-                    out.append(f'\t.div\t\t= DIVIDER(0x{self.clk_div.div_offset:04x}, {self.clk_div.div_shift}, {mask_to_width(self.clk_div.div_mask)}),')
+                    div = f'\t.div\t\t= DIVIDER(0x{self.clk_div.div_offset:04x}, {self.clk_div.div_shift}, {mask_to_width(self.clk_div.div_mask)}),\n'
             # .trig:
             if self.clk_div.div_trig_offset is not None:
-                out.append(f'\t.trig\t\t= TRIGGER(0x{self.clk_div.div_trig_offset:04x}, {self.clk_div.div_trig_shift}),')
+                trig = f'\t.trig\t\t= TRIGGER(0x{self.clk_div.div_trig_offset:04x}, {self.clk_div.div_trig_shift}),\n'
 
-        out.append('};')
+        return _STRUCT_TMPL.format(clk_type=self.__clk_type__, name=self.name,
+                                   policy=policy, gate=gate, hyst=hyst, sel=sel, div=div, trig=trig)
 
-        return '\n'.join(out)
+PeriClock._FIELDS = frozenset(field.name for field in fields(PeriClock))
 
 class BusClock(PeriClock):
+    __slots__ = ()
     __clk_type__ = 'bus'
 
     freq_tbl_index: Optional[int] = None
 
 class RefClock(PeriClock):
+    __slots__ = ()
     __clk_type__ = 'ref'
 
 # Actual program logic
@@ -269,16 +293,20 @@ parser = argparse.ArgumentParser(
 parser.add_argument("kernel_path", help="Path to downstream kernel source")
 parser.add_argument("mach", help="Machine (mach-XXX folder)")
 parser.add_argument("name", help="Name of the clock to extract")
+parser.add_argument("--json", action="store_true", help="Print the parsed clock data as JSON instead of a mainline struct")
 
 args = parser.parse_args()
 
 
-with open(os.path.join(args.kernel_path, 'arch', 'arm', f'mach-{args.mach}', 'clock.c')) as clock_in:
-    clock_raw = find_clock(clock_in.read(), args.name)
+with open(os.path.join(args.kernel_path, 'arch', 'arm', f'mach-{args.mach}', 'clock.c'), 'rb') as clock_in, \
+        mmap.mmap(clock_in.fileno(), 0, access=mmap.ACCESS_READ) as clock_map:
+    clock_raw = find_clock(clock_map, args.name)
     if not clock_raw:
         print(f"Failed to find clock: {args.name}")
         quit(1)
-    clock_dict = struct_to_dict(clock_raw[1])
+    # Header parsing is I/O bound, so overlap it with reading the struct.
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        clock_dict = struct_to_dict(clock_raw[1], executor)
 
     if clock_raw[0] == 'peri':
         clk = PeriClock.from_dict(clock_dict, name=args.name)
@@ -287,4 +315,7 @@ with open(os.path.join(args.kernel_path, 'arch', 'arm', f'mach-{args.mach}', 'cl
     elif clock_raw[0] == 'ref':
         clk = RefClock.from_dict(clock_dict, name=args.name)
 
-    print(clk.to_mainline_struct())
+    if args.json:
+        print(json.dumps({'clk_type': clk.__clk_type__, **asdict(clk)}, indent=2))
+    else:
+        print(clk.to_mainline_struct())
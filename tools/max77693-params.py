@@ -1,5 +1,13 @@
 #!/usr/bin/python3
 
+import argparse
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # MODIFY WITH YOUR VALUES:
 CHG_CNFG_01 = 0x34  # 0xB8
 CHG_CNFG_02 = 0xb6  # 0xB9
@@ -9,57 +17,106 @@ CHG_CNFG_07 = 0x9e  # 0xBE
 CHG_CNFG_09 = 0x2d  # 0xC0
 CHG_CNFG_12 = 0x07  # 0xC3
 
-# Input current limit
-chgin_current_limit_raw = CHG_CNFG_09 & 0x7F
-if chgin_current_limit_raw < 3:
-    chgin_current_limit = 60000
-else:
-    chgin_current_limit = chgin_current_limit_raw * 20000
-
-# Fast charge current limit
-cc_raw = CHG_CNFG_02 & 0x3F
-cc = cc_raw * 33300
-
-# Charging constant voltage
-chg_constant_volt_raw = CHG_CNFG_04 & 0x1f
-if chg_constant_volt_raw < 0x1c:
-    chg_constant_volt = 3650000 + chg_constant_volt_raw * 25000
-elif chg_constant_volt_raw == 0x1c:
-    chg_constant_volt = 4340000
-else:
-    chg_constant_volt = 4350000 + ((chg_constant_volt_raw - 0x1d) * 25000)
+REGISTERS = {
+    "CHG_CNFG_01": CHG_CNFG_01,
+    "CHG_CNFG_02": CHG_CNFG_02,
+    "CHG_CNFG_03": CHG_CNFG_03,
+    "CHG_CNFG_04": CHG_CNFG_04,
+    "CHG_CNFG_07": CHG_CNFG_07,
+    "CHG_CNFG_09": CHG_CNFG_09,
+    "CHG_CNFG_12": CHG_CNFG_12,
+}
 
-# Minimum system regulation voltage
-minvsys_raw = (CHG_CNFG_04 & (0x7 << 5)) >> 5
-minvsys = 3000000 + minvsys_raw * 100000
+def select(cond, a, b):
+    """Pick a if cond else b; works on both ints and numpy arrays."""
+    if np is not None and isinstance(cond, np.ndarray):
+        return np.where(cond, a, b)
+    return a if cond else b
 
-# Thermal regulation temp
-regtemp_raw = (CHG_CNFG_07 & (0x3 << 5)) >> 5
-regtemp = 70 + regtemp_raw * 15
+def chg_constant_volt(raw):
+    return select(raw < 0x1c, 3650000 + raw * 25000,
+                  select(raw == 0x1c, 4340000, 4350000 + ((raw - 0x1d) * 25000)))
 
-# Battery overcurrent
-bat_overcurrent_raw = CHG_CNFG_12 & 0x7
-if bat_overcurrent_raw != 0:
-    bat_overcurrent = 2000000 + (bat_overcurrent_raw - 1) * 250000
-else:
-    bat_overcurrent = 0
+# (name, register, mask, shift, raw value -> value)
+FIELDS = (
+    # Input current limit
+    ("chgin_current_limit", "CHG_CNFG_09", 0x7F, 0,
+        lambda raw: select(raw < 3, 60000, raw * 20000)),
+    # Fast charge current limit
+    ("cc", "CHG_CNFG_02", 0x3F, 0,
+        lambda raw: raw * 33300),
+    # Charging constant voltage
+    ("chg_constant_volt", "CHG_CNFG_04", 0x1f, 0,
+        chg_constant_volt),
+    # Minimum system regulation voltage
+    ("minvsys", "CHG_CNFG_04", 0x7 << 5, 5,
+        lambda raw: 3000000 + raw * 100000),
+    # Thermal regulation temp
+    ("regtemp", "CHG_CNFG_07", 0x3 << 5, 5,
+        lambda raw: 70 + raw * 15),
+    # Battery overcurrent
+    ("bat_overcurrent", "CHG_CNFG_12", 0x7, 0,
+        lambda raw: select(raw != 0, 2000000 + (raw - 1) * 250000, 0)),
+    # Charge input threshold
+    ("charge_input_threshold", "CHG_CNFG_12", 0x3 << 3, 3,
+        lambda raw: select(raw == 0, 4300000, 4700000 + (raw - 1) * 100000)),
+)
 
-# Charge input threshold
-charge_input_threshold_raw = (CHG_CNFG_12 & (0x3 << 3)) >> 3
-if charge_input_threshold_raw == 0:
-    charge_input_threshold = 4300000
-else:
-    charge_input_threshold = 4700000 + (charge_input_threshold_raw - 1) * 100000
+def decode(registers: dict) -> dict:
+    """Decode the charger parameters from a {register name: value} dict."""
+    params = {}
+    for name, reg, mask, shift, fn in FIELDS:
+        params[name] = fn((registers[reg] & mask) >> shift)
+    return params
+
+def print_params(params: dict):
+    print("Charger parameters:")
+    print(f"maxim,constant-microvolt: <{params['chg_constant_volt']}>;")
+    print(f"maxim,min-system-microvolt: <{params['minvsys']}>;")
+    print(f"maxim,thermal-regulation-celsius: <{params['regtemp']}>;")
+    print(f"maxim,battery-overcurrent-microamp: <{params['bat_overcurrent']}>;")
+    print(f"maxim,charge-input-threshold-microvolt: <{params['charge_input_threshold']}>;")
+    print()
+    print("Battery node parameters:")
+    print(f"constant-charge-current-max-microamp: <{params['cc']}>;")
 
-# --- #
+parser = argparse.ArgumentParser(
+                    prog='max77693-params.py',
+                    description='Convert MAX77693 charger register values to DT properties')
 
-print("Charger parameters:")
-print(f"maxim,constant-microvolt: <{chg_constant_volt}>;")
-print(f"maxim,min-system-microvolt: <{minvsys}>;")
-print(f"maxim,thermal-regulation-celsius: <{regtemp}>;")
-print(f"maxim,battery-overcurrent-microamp: <{bat_overcurrent}>;")
-print(f"maxim,charge-input-threshold-microvolt: <{charge_input_threshold}>;")
-print()
-print("Battery node parameters:")
-print(f"constant-charge-current-max-microamp: <{cc}>;")
+parser.add_argument("--batch", metavar="FILE", help="Decode a file with one device per line, given as the "
+                    f"{', '.join(REGISTERS)} values in hex (requires numpy)")
 
+args = parser.parse_args()
+
+if args.batch:
+    if np is None:
+        parser.error("--batch requires numpy")
+
+    rows = []
+    with open(args.batch) as batch_in:
+        for lineno, line in enumerate(batch_in, 1):
+            tokens = line.split()
+            if not tokens:
+                continue
+            if len(tokens) != len(REGISTERS):
+                parser.error(f"{args.batch}:{lineno}: expected {len(REGISTERS)} register values, got {len(tokens)}")
+
+            row = []
+            for token in tokens:
+                m = re.fullmatch(r'(?:0x)?([0-9a-f]{1,2})', token, re.IGNORECASE)
+                if m is None:
+                    parser.error(f"{args.batch}:{lineno}: expected a register value between 0x00 and 0xff, got {token!r}")
+                row.append(int(m.group(1), 16))
+            rows.append(row)
+
+    regs = np.asarray(rows, dtype=np.uint8).reshape(-1, len(REGISTERS))
+    params = decode({name: regs[:, i].astype(np.int32) for i, name in enumerate(REGISTERS)})
+
+    for i, row in enumerate(regs):
+        if i:
+            print()
+        print(f"# {' '.join(f'0x{v:02x}' for v in row)}")
+        print_params({name: value[i] for name, value in params.items()})
+else:
+    print_params(decode(REGISTERS))